@@ -2,83 +2,120 @@
 
 import json
 import csv
+import multiprocessing
 import os
-from datetime import datetime, timezone
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+
+# ciso8601 is an optional C parser; datetime.fromisoformat is used when it's not installed.
+try:
+    import ciso8601
+    _parse_iso = ciso8601.parse_datetime
+except ImportError:
+    _parse_iso = datetime.fromisoformat
+
+# orjson is an optional, faster JSON decoder; its JSONDecodeError subclasses json.JSONDecodeError.
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # --- Configuration ---
 BASE_SOURCE_DIR = "../DI_CONNECT"  # Assuming parser.py is in garmin_csv_export
 TARGET_DIR = "." # Output CSVs in the same directory as the script
+CSV_WRITE_BUFFER_SIZE = 1 << 20 # 1 MiB output buffer, so large CSVs are written in few syscalls
+# File-parsing pools are started from worker threads; spawned (rather than forked) children
+# can't inherit a lock, such as stdout's, held by another thread at fork time.
+_POOL_CONTEXT = multiprocessing.get_context("spawn")
 
 # Date range for filtering
 START_DATE_FILTER = datetime(2020, 2, 1, tzinfo=timezone.utc)
 END_DATE_FILTER = datetime(2025, 6, 30, tzinfo=timezone.utc)
 
+# "YYYY-MM-DD" bounds for pre-filtering raw timestamp strings before they are parsed.
+# Widened by a day on each side, since a local-time prefix can fall on a different date than its UTC value.
+_START_DATE_STR = (START_DATE_FILTER - timedelta(days=1)).strftime("%Y-%m-%d")
+_END_DATE_STR = (END_DATE_FILTER + timedelta(days=1)).strftime("%Y-%m-%d")
+
 # --- Helper Functions ---
-def safe_get(data, keys, default=None):
-    """Safely get a value from a nested dictionary."""
-    for key in keys:
-        if isinstance(data, dict) and key in data:
-            data = data[key]
-        else:
-            return default
-    return data
+_ISO_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6})\d*)?(Z|[+-]\d{2}:?\d{2})?)?')
 
+@lru_cache(maxsize=None) # calendarDate and GMT timestamps repeat heavily across records
 def parse_garmin_timestamp(ts_str):
     """Parses various Garmin timestamp formats to a timezone-aware datetime object."""
     if not ts_str:
         return None
     try:
-        # Try formats with milliseconds and timezone offset (e.g., "2020-02-15T13:19:26.265Z" or "...+00:00")
-        if '.' in ts_str and ('Z' in ts_str or '+' in ts_str or '-' in ts_str[10:]): # Check for timezone indicator after year
-            # Handle Z for UTC
-            if ts_str.endswith('Z'):
+        match = _ISO_RE.fullmatch(ts_str)
+        if match is None:
+            # Anything the pattern doesn't cover goes through the general ISO parser.
+            # Handle Z for UTC and timezone offsets without a colon (e.g. "-0700")
+            if ts_str[-1] == 'Z':
                 ts_str = ts_str[:-1] + "+00:00"
-            
-            # Handle timezone offsets like +02:00 or -0700
-            if ":" == ts_str[-3:-2]: # e.g. +02:00
-                 dt_obj = datetime.fromisoformat(ts_str)
-            elif len(ts_str) > 6 and ts_str[-5] in ['+', '-'] and ts_str[-3] not in [':']: # e.g. -0700
-                ts_str_with_colon = ts_str[:-2] + ":" + ts_str[-2:]
-                dt_obj = datetime.fromisoformat(ts_str_with_colon)
-            else: # Assume it's parsable if it has a decimal for seconds
-                 dt_obj = datetime.fromisoformat(ts_str)
-
-        # Try "YYYY-MM-DDTHH:MM:SS.0" (GMT/UTC assumed)
-        elif '.' in ts_str:
-            dt_obj = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=timezone.utc)
-        # Try "YYYY-MM-DDTHH:MM:SS" (GMT/UTC assumed)
-        elif 'T' in ts_str and len(ts_str) == 19 :
-             dt_obj = datetime.strptime(ts_str, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
-        # Try "YYYY-MM-DD" (midnight UTC assumed)
-        elif len(ts_str) == 10 and '-' in ts_str:
-            dt_obj = datetime.strptime(ts_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            elif len(ts_str) > 19 and ts_str[-5] in '+-' and ts_str[-3] != ':':
+                ts_str = ts_str[:-2] + ":" + ts_str[-2:]
+            dt_obj = _parse_iso(ts_str)
+            if dt_obj.tzinfo is None:
+                dt_obj = dt_obj.replace(tzinfo=timezone.utc)
+            else:
+                dt_obj = dt_obj.astimezone(timezone.utc)
+        # "YYYY-MM-DD" (midnight UTC assumed)
+        elif match.group(4) is None:
+            dt_obj = datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)), tzinfo=timezone.utc)
         else:
-            print(f"Warning: Unrecognized date format for timestamp: {ts_str}")
-            return None
-        
-        return dt_obj.astimezone(timezone.utc) # Ensure all are UTC for comparison
+            fraction = match.group(7)
+            dt_obj = datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)),
+                              int(match.group(4)), int(match.group(5)), int(match.group(6)),
+                              int(fraction.ljust(6, '0')) if fraction else 0, tzinfo=timezone.utc)
+            # Timestamps without an offset are GMT/UTC (e.g. "sleepStartTimestampGMT").
+            # A real offset is subtracted directly so the result is already in UTC.
+            tz_str = match.group(8)
+            if tz_str is not None and tz_str != 'Z':
+                offset_hours, offset_minutes = int(tz_str[1:3]), int(tz_str[-2:])
+                if offset_hours >= 24 or offset_minutes >= 60:
+                    raise ValueError(f"invalid UTC offset '{tz_str}'")
+                offset = timedelta(hours=offset_hours, minutes=offset_minutes)
+                dt_obj = dt_obj + offset if tz_str[0] == '-' else dt_obj - offset
+
+        return dt_obj # Always UTC for comparison
     except ValueError as e:
         print(f"Warning: Could not parse timestamp '{ts_str}': {e}")
         return None
 
-def is_in_date_range(dt_obj):
-    if dt_obj is None:
+# Dashed "YYYY-MM-DD" (sleep exports) or compact "YYYYMMDD" (MET exports) dates, not part of a longer number.
+# Compact tokens must start with 19/20 so 8-digit account IDs aren't taken for dates.
+_FILENAME_DATE_RE = re.compile(r'(?<!\d)(\d{4}-\d{2}-\d{2}|(?:19|20)\d{6})(?!\d)')
+
+def file_in_date_range(filename, open_ended=False):
+    """Checks whether the date span embedded in a Garmin export filename overlaps the filter range.
+    With open_ended, only the span's first date is checked, for files whose rows can be dated later than the span.
+    Filenames without a recognizable date are always processed."""
+    file_dates = []
+    for token in _FILENAME_DATE_RE.findall(filename):
+        try:
+            file_dates.append(datetime.strptime(token, "%Y-%m-%d" if '-' in token else "%Y%m%d").date())
+        except ValueError:
+            continue
+    if not file_dates:
+        return True
+    if min(file_dates) > END_DATE_FILTER.date():
         return False
-    # Ensure dt_obj is timezone-aware (UTC) for comparison
-    if dt_obj.tzinfo is None:
-        dt_obj = dt_obj.replace(tzinfo=timezone.utc)
-    return START_DATE_FILTER <= dt_obj <= END_DATE_FILTER
+    return open_ended or max(file_dates) >= START_DATE_FILTER.date()
 
 def format_datetime_csv(dt_obj):
     """Formats datetime object to 'YYYY-MM-DDTHH:MM:SS' for CSV."""
     if dt_obj:
-        return dt_obj.strftime("%Y-%m-%dT%H:%M:%S")
+        return (f"{dt_obj.year:04d}-{dt_obj.month:02d}-{dt_obj.day:02d}"
+                f"T{dt_obj.hour:02d}:{dt_obj.minute:02d}:{dt_obj.second:02d}")
     return ''
 
 def format_date_csv(dt_obj):
     """Formats datetime object to 'YYYY-MM-DD' for CSV."""
     if dt_obj:
-        return dt_obj.strftime("%Y-%m-%d")
+        return f"{dt_obj.year:04d}-{dt_obj.month:02d}-{dt_obj.day:02d}"
     return ''
 
 # --- Processing Functions ---
@@ -95,13 +132,17 @@ def process_user_biometrics():
         print(f"Warning: Source file not found: {source_file}")
         return
 
-    with open(source_file, 'r', encoding='utf-8') as f:
+    with open(source_file, 'rb') as f:
         try:
-            data = json.load(f)
+            data = _json_loads(f.read())
         except json.JSONDecodeError as e:
             print(f"Error decoding JSON from {source_file}: {e}")
             return
 
+    seen_datetimes = set()
+    # parse_garmin_timestamp always returns aware UTC datetimes, so compare against the bounds directly.
+    start, end = START_DATE_FILTER, END_DATE_FILTER
+    start_str, end_str = _START_DATE_STR, _END_DATE_STR
     for record in data:
         # 'calendarDate' in metaData is usually the primary timestamp
         # Sometimes it's a full datetime string, sometimes just a date.
@@ -110,10 +151,13 @@ def process_user_biometrics():
         # Resting HR, HRV, Stress etc. are often daily averages or specific samples.
         # The Garmin export doesn't always provide fine-grained continuous data here.
 
-        record_dt_str = safe_get(record, ["metaData", "calendarDate"])
+        record_dt_str = (record.get("metaData") or {}).get("calendarDate")
+        # ISO dates sort lexicographically, so records far outside the range are skipped unparsed.
+        if not record_dt_str or not start_str <= record_dt_str[:10] <= end_str:
+            continue
         record_dt = parse_garmin_timestamp(record_dt_str)
 
-        if record_dt and is_in_date_range(record_dt):
+        if record_dt is not None and start <= record_dt <= end:
             #resting_hr: Not directly available in userBioMetrics.json in a simple daily way.
             #   It's usually derived from wellness summaries or specific heart rate samples.
             #   We'll leave it blank for now.
@@ -130,125 +174,173 @@ def process_user_biometrics():
             # For this parser, we will output the datetime and leave others blank as they are not in this specific file.
             # A more complete solution would involve parsing other files (e.g. dailies if they exist in the export).
 
-            csv_row = {
-                "datetime": format_datetime_csv(record_dt),
-                "resting_hr": safe_get(record, ["restingHeartRate"], ''), # Placeholder if available
-                "hrv": '',         # Placeholder
-                "stress_level": '',# Placeholder
-                "body_battery": '',# Placeholder
-                "spo2": '',        # Placeholder
-                "respiration_rate": '' # Placeholder
-            }
+            # Row values follow csv_headers order.
+            csv_row = (
+                format_datetime_csv(record_dt),                 # datetime
+                record.get("restingHeartRate", ''),             # resting_hr, placeholder if available
+                '',                                             # hrv, placeholder
+                '',                                             # stress_level, placeholder
+                '',                                             # body_battery, placeholder
+                '',                                             # spo2, placeholder
+                '',                                             # respiration_rate, placeholder
+            )
             # This file is more about profile changes. We might get multiple entries for the same day.
             # Let's just add one entry per valid date for demonstration.
             # A real use case might need to decide how to aggregate/select.
-            if not any(r["datetime"] == csv_row["datetime"] for r in processed_rows):
-                 processed_rows.append(csv_row)
+            if csv_row[0] not in seen_datetimes:
+                processed_rows.append(csv_row)
+                seen_datetimes.add(csv_row[0])
 
 
     if processed_rows:
         # Sort by datetime just in case records are not ordered
-        processed_rows.sort(key=lambda x: x["datetime"])
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f_csv:
-            writer = csv.DictWriter(f_csv, fieldnames=csv_headers)
-            writer.writeheader()
+        processed_rows.sort(key=lambda row: row[0])
+        with open(csv_file, 'w', newline='', encoding='utf-8', buffering=CSV_WRITE_BUFFER_SIZE) as f_csv:
+            writer = csv.writer(f_csv)
+            writer.writerow(csv_headers)
             writer.writerows(processed_rows)
         print(f"Finished processing. {len(processed_rows)} rows written to {csv_file}")
     else:
         print(f"No data found for the specified date range in {source_file}")
         # Create empty CSV with headers if no data
         with open(csv_file, 'w', newline='', encoding='utf-8') as f_csv:
-            writer = csv.DictWriter(f_csv, fieldnames=csv_headers)
-            writer.writeheader()
+            writer = csv.writer(f_csv)
+            writer.writerow(csv_headers)
 
 
+def _parse_sleep_file(file_path):
+    """Parses one *_sleepData.json file into sleep CSV rows within the date range."""
+    rows = []
+    with open(file_path, 'rb') as f:
+        try:
+            data = _json_loads(f.read())
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON from {file_path}: {e}")
+            return rows
+
+    start, end = START_DATE_FILTER, END_DATE_FILTER
+    start_str, end_str = _START_DATE_STR, _END_DATE_STR
+    for record in data:
+        record_date_str = record.get("calendarDate")
+        if not record_date_str or not start_str <= record_date_str[:10] <= end_str:
+            continue
+        record_dt = parse_garmin_timestamp(record_date_str)
+
+        if record_dt is not None and start <= record_dt <= end:
+            deep_seconds = record.get("deepSleepSeconds", 0) or 0
+            rem_seconds = record.get("remSleepSeconds", 0) or 0
+            light_seconds = record.get("lightSleepSeconds", 0) or 0
+            awake_seconds = record.get("awakeSleepSeconds", 0) or 0
+            
+            # sleep_duration should be total time in bed or total sleep time?
+            # Garmin Connect usually shows total sleep time (deep+light+rem).
+            # Your example "423" suggests minutes for "sleep_duration".
+            # Minutes are rounded half-up with integer arithmetic: (seconds + 30) // 60.
+            total_sleep_minutes = (deep_seconds + light_seconds + rem_seconds + 30) // 60
+            
+            # wake_time in your example is "21". This could be (awake_seconds / 60).
+            wake_minutes = (awake_seconds + 30) // 60
+
+            # sleep_score: Not directly in this detailed sleepData.json. Often in a daily summary. Placeholder.
+            # resting_hr_sleep: Can sometimes be in spo2SleepSummary.averageHR. Placeholder.
+            # hrv_sleep: Not directly available in sleepData. Placeholder.
+
+            # Row values follow csv_headers order in process_sleep_data.
+            csv_row = (
+                format_date_csv(record_dt),                                   # date
+                total_sleep_minutes,                                          # sleep_duration
+                (deep_seconds + 30) // 60,                                    # deep_sleep
+                (rem_seconds + 30) // 60,                                     # rem_sleep
+                (light_seconds + 30) // 60,                                   # light_sleep
+                wake_minutes,                                                 # wake_time
+                (record.get("overallSleepScore") or {}).get("value", ''),     # sleep_score, check if available
+                (record.get("spo2SleepSummary") or {}).get("averageHR", ''),  # resting_hr_sleep
+                '',                                                           # hrv_sleep, placeholder
+            )
+            rows.append(csv_row)
+    return rows
+
 def process_sleep_data():
     source_dir = os.path.join(BASE_SOURCE_DIR, "DI-Connect-Wellness")
     csv_file = os.path.join(TARGET_DIR, "sleep_data.csv")
     csv_headers = ["date", "sleep_duration", "deep_sleep", "rem_sleep", "light_sleep", "wake_time", "sleep_score", "resting_hr_sleep", "hrv_sleep"]
     
     print(f"Processing sleep data from {source_dir} for {csv_file}...")
-    all_sleep_records = []
+    all_sleep_records = {} # date -> row; dicts keep insertion order, so the first row per date wins
 
     if not os.path.exists(source_dir):
         print(f"Warning: Source directory not found: {source_dir}")
         return
 
-    for filename in os.listdir(source_dir):
-        if "_sleepData.json" in filename:
-            file_path = os.path.join(source_dir, filename)
-            # Optional: Add filename-based date pre-filtering here if needed
-            # to skip files entirely outside the Feb 2020 - June 2025 range.
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON from {file_path}: {e}")
-                    continue
-                
-                for record in data:
-                    record_date_str = safe_get(record, ["calendarDate"])
-                    record_dt = parse_garmin_timestamp(record_date_str)
-
-                    if record_dt and is_in_date_range(record_dt):
-                        sleep_start_dt = parse_garmin_timestamp(safe_get(record, ["sleepStartTimestampGMT"]))
-                        sleep_end_dt = parse_garmin_timestamp(safe_get(record, ["sleepEndTimestampGMT"]))
-                        
-                        duration_seconds = 0
-                        if sleep_start_dt and sleep_end_dt:
-                            duration_seconds = (sleep_end_dt - sleep_start_dt).total_seconds()
-                        
-                        deep_seconds = safe_get(record, ["deepSleepSeconds"], 0)
-                        rem_seconds = safe_get(record, ["remSleepSeconds"], 0)
-                        light_seconds = safe_get(record, ["lightSleepSeconds"], 0)
-                        awake_seconds = safe_get(record, ["awakeSleepSeconds"], 0)
-                        
-                        # sleep_duration should be total time in bed or total sleep time?
-                        # Garmin Connect usually shows total sleep time (deep+light+rem).
-                        # Your example "423" suggests minutes for "sleep_duration".
-                        total_sleep_minutes = round((deep_seconds + light_seconds + rem_seconds) / 60) if (deep_seconds + light_seconds + rem_seconds) > 0 else 0
-                        
-                        # wake_time in your example is "21". This could be (awake_seconds / 60).
-                        wake_minutes = round(awake_seconds / 60) if awake_seconds else 0
-
-                        # sleep_score: Not directly in this detailed sleepData.json. Often in a daily summary. Placeholder.
-                        # resting_hr_sleep: Can sometimes be in spo2SleepSummary.averageHR. Placeholder.
-                        # hrv_sleep: Not directly available in sleepData. Placeholder.
-
-                        csv_row = {
-                            "date": format_date_csv(record_dt),
-                            "sleep_duration": total_sleep_minutes,
-                            "deep_sleep": round(deep_seconds / 60) if deep_seconds else 0,
-                            "rem_sleep": round(rem_seconds / 60) if rem_seconds else 0,
-                            "light_sleep": round(light_seconds / 60) if light_seconds else 0,
-                            "wake_time": wake_minutes,
-                            "sleep_score": safe_get(record, ["overallSleepScore", "value"], ''), # Check if available
-                            "resting_hr_sleep": safe_get(record, ["spo2SleepSummary", "averageHR"], ''),
-                            "hrv_sleep": '' # Placeholder
-                        }
-                        all_sleep_records.append(csv_row)
+    # Skip files whose filename date span lies entirely outside the filter range;
+    # the per-record date check still applies to the files that are opened.
+    with os.scandir(source_dir) as entries:
+        file_paths = [entry.path for entry in entries
+                      if "_sleepData.json" in entry.name and file_in_date_range(entry.name)]
+
+    # Files are independent, so decode and parse them in parallel worker processes.
+    with ProcessPoolExecutor(mp_context=_POOL_CONTEXT) as executor:
+        for rows in executor.map(_parse_sleep_file, file_paths, chunksize=4):
+            for row in rows:
+                all_sleep_records.setdefault(row[0], row)
 
     if all_sleep_records:
-        all_sleep_records.sort(key=lambda x: x["date"])
-        # Remove duplicates by date, keeping the first one encountered (or last, if sorted differently)
-        unique_sleep_records = []
-        seen_dates = set()
-        for rec in all_sleep_records:
-            if rec["date"] not in seen_dates:
-                unique_sleep_records.append(rec)
-                seen_dates.add(rec["date"])
+        unique_sleep_records = sorted(all_sleep_records.values(), key=lambda row: row[0])
         
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f_csv:
-            writer = csv.DictWriter(f_csv, fieldnames=csv_headers)
-            writer.writeheader()
+        with open(csv_file, 'w', newline='', encoding='utf-8', buffering=CSV_WRITE_BUFFER_SIZE) as f_csv:
+            writer = csv.writer(f_csv)
+            writer.writerow(csv_headers)
             writer.writerows(unique_sleep_records)
         print(f"Finished processing sleep data. {len(unique_sleep_records)} rows written to {csv_file}")
     else:
         print(f"No sleep data found for the specified date range in {source_dir}")
         with open(csv_file, 'w', newline='', encoding='utf-8') as f_csv:
-            writer = csv.DictWriter(f_csv, fieldnames=csv_headers)
-            writer.writeheader()
+            writer = csv.writer(f_csv)
+            writer.writerow(csv_headers)
+
+def _parse_met_file(file_path):
+    """Parses one MetricsMaxMetData_*.json file into MET CSV rows within the date range."""
+    rows = []
+    with open(file_path, 'rb') as f:
+        try:
+            data = _json_loads(f.read())
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON from {file_path}: {e}")
+            return rows
+
+    start, end = START_DATE_FILTER, END_DATE_FILTER
+    start_str, end_str = _START_DATE_STR, _END_DATE_STR
+    for record in data:
+        # 'updateTimestamp' seems to be the most relevant start_time for the MET data point
+        record_dt_str = record.get("updateTimestamp")
+        calendar_date_str = record.get("calendarDate")
+        # Either string may end up dating the record (see the fallback below), so skip only if neither is in range.
+        if not ((record_dt_str and start_str <= record_dt_str[:10] <= end_str)
+                or (calendar_date_str and start_str <= calendar_date_str[:10] <= end_str)):
+            continue
+        record_dt = parse_garmin_timestamp(record_dt_str)
+        
+        # Also check 'calendarDate' for filtering if 'updateTimestamp' is missing or out of primary range
+        if not record_dt:
+            record_dt = parse_garmin_timestamp(calendar_date_str)
+
+
+        if record_dt is not None and start <= record_dt <= end:
+            # duration_min, avg_hr, max_hr, training_effect are not directly in MetricsMaxMetData.
+            # These typically come from detailed activity files.
+            # We will populate what's available from MetricsMaxMetData.
+            # Row values follow csv_headers order in process_max_met_data.
+            csv_row = (
+                format_datetime_csv(record_dt),         # start_time
+                record.get("sport", ''),                # activity_type
+                '',                                     # duration_min, placeholder
+                record.get("maxMet", ''),               # max_met
+                '',                                     # avg_hr, placeholder
+                '',                                     # max_hr, placeholder
+                '',                                     # training_effect, placeholder
+            )
+            rows.append(csv_row)
+    return rows
 
 def process_max_met_data():
     source_dir = os.path.join(BASE_SOURCE_DIR, "DI-Connect-Metrics")
@@ -256,68 +348,37 @@ def process_max_met_data():
     csv_headers = ["start_time", "activity_type", "duration_min", "max_met", "avg_hr", "max_hr", "training_effect"]
 
     print(f"Processing METs data from {source_dir} for {csv_file}...")
-    all_met_records = []
+    all_met_records = {} # start_time -> row, keeping the first one encountered
 
     if not os.path.exists(source_dir):
         print(f"Warning: Source directory not found: {source_dir}")
         return
 
-    for filename in os.listdir(source_dir):
-        if "MetricsMaxMetData_" in filename and filename.endswith(".json"):
-            file_path = os.path.join(source_dir, filename)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON from {file_path}: {e}")
-                    continue
-
-                for record in data:
-                    # 'updateTimestamp' seems to be the most relevant start_time for the MET data point
-                    record_dt_str = safe_get(record, ["updateTimestamp"]) 
-                    record_dt = parse_garmin_timestamp(record_dt_str)
-                    
-                    # Also check 'calendarDate' for filtering if 'updateTimestamp' is missing or out of primary range
-                    if not record_dt:
-                        calendar_date_str = safe_get(record, ["calendarDate"])
-                        record_dt = parse_garmin_timestamp(calendar_date_str)
-
-
-                    if record_dt and is_in_date_range(record_dt):
-                        # duration_min, avg_hr, max_hr, training_effect are not directly in MetricsMaxMetData.
-                        # These typically come from detailed activity files.
-                        # We will populate what's available from MetricsMaxMetData.
-                        csv_row = {
-                            "start_time": format_datetime_csv(record_dt),
-                            "activity_type": safe_get(record, ["sport"], ''),
-                            "duration_min": '', # Placeholder
-                            "max_met": safe_get(record, ["maxMet"], ''),
-                            "avg_hr": '',       # Placeholder
-                            "max_hr": '',       # Placeholder
-                            "training_effect": '' # Placeholder
-                        }
-                        all_met_records.append(csv_row)
+    # MET rows are dated by updateTimestamp, which can fall after the filename's calendarDate span,
+    # so only files starting after the filter range are skipped.
+    with os.scandir(source_dir) as entries:
+        file_paths = [entry.path for entry in entries
+                      if "MetricsMaxMetData_" in entry.name and entry.name.endswith(".json")
+                      and file_in_date_range(entry.name, open_ended=True)]
+
+    with ProcessPoolExecutor(mp_context=_POOL_CONTEXT) as executor:
+        for rows in executor.map(_parse_met_file, file_paths, chunksize=4):
+            for row in rows:
+                all_met_records.setdefault(row[0], row)
     
     if all_met_records:
-        all_met_records.sort(key=lambda x: x["start_time"])
-        # Remove duplicates by start_time, keeping the first
-        unique_met_records = []
-        seen_times = set()
-        for rec in all_met_records:
-            if rec["start_time"] not in seen_times:
-                unique_met_records.append(rec)
-                seen_times.add(rec["start_time"])
+        unique_met_records = sorted(all_met_records.values(), key=lambda row: row[0])
 
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f_csv:
-            writer = csv.DictWriter(f_csv, fieldnames=csv_headers)
-            writer.writeheader()
+        with open(csv_file, 'w', newline='', encoding='utf-8', buffering=CSV_WRITE_BUFFER_SIZE) as f_csv:
+            writer = csv.writer(f_csv)
+            writer.writerow(csv_headers)
             writer.writerows(unique_met_records)
         print(f"Finished processing METs data. {len(unique_met_records)} rows written to {csv_file}")
     else:
         print(f"No METs data found for the specified date range in {source_dir}")
         with open(csv_file, 'w', newline='', encoding='utf-8') as f_csv:
-            writer = csv.DictWriter(f_csv, fieldnames=csv_headers)
-            writer.writeheader()
+            writer = csv.writer(f_csv)
+            writer.writerow(csv_headers)
 
 
 # --- Main Execution ---
@@ -325,8 +386,10 @@ if __name__ == "__main__":
     if not os.path.exists(TARGET_DIR):
         os.makedirs(TARGET_DIR)
     
-    process_user_biometrics()
-    process_sleep_data()
-    process_max_met_data()
+    # The processors read disjoint inputs and write disjoint CSVs, so run them concurrently.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(process) for process in (process_user_biometrics, process_sleep_data, process_max_met_data)]
+        for future in futures:
+            future.result() # Re-raise any error from a processor
     
     print("\\nAll processing complete.") 
\ No newline at end of file